@@ -1,7 +1,9 @@
 from typing import List, Optional, Any, Dict
 
+import orjson
 from app.routers import crm_router
-from fastapi import Depends, HTTPException
+from fastapi import Body, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import (
     OperatorCreate,
@@ -11,12 +13,13 @@ from app.models import (
     SourceOut,
     OperatorSourceWeightCreate,
     ContactCreate,
+    ContactBatchItem,
+    CONTACT_BATCH_MAX_SIZE,
     ContactOut,
     LeadsAndContactsOut,
 )
+from app.db import get_session
 from app.repository import (
-    get_session,
-    get_session_sync,
     OperatorRepository,
     SourceRepository,
     WeightRepository,
@@ -44,15 +47,12 @@ async def create_operator(
     :param db_session: асинхронная сессия БД
     :return: модель OperatorOut
     """
-    try:
-        return await OperatorRepository.create(
-            db_session,
-            name=data.name,
-            is_active=data.is_active,
-            max_concurrent=data.max_concurrent,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    return await OperatorRepository.create(
+        db_session,
+        name=data.name,
+        is_active=data.is_active,
+        max_concurrent=data.max_concurrent,
+    )
 
 
 @crm_router.get(
@@ -67,10 +67,7 @@ async def list_operators(db_session: AsyncSession = Depends(get_session)):
     :param db_session: сессия БД
     :return: список операторов
     """
-    try:
-        return await OperatorRepository.get_all(db_session)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    return await OperatorRepository.get_all(db_session)
 
 
 @crm_router.patch(
@@ -91,13 +88,10 @@ async def update_operator(
     :param db_session: сессия БД
     :return: модель OperatorOut
     """
-    try:
-        op = await OperatorRepository.update(db_session, data, operator_id=operator_id)
-        if not op:
-            raise HTTPException(status_code=404, detail="Operator not found")
-        return op
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    op = await OperatorRepository.update(db_session, data, operator_id=operator_id)
+    if not op:
+        raise HTTPException(status_code=404, detail="Operator not found")
+    return op
 
 
 @crm_router.post(
@@ -115,12 +109,9 @@ async def create_source(
     :param db_session: сессия БД
     :return: модель SourceOut
     """
-    try:
-        return await SourceRepository.create(
-            db_session, name=data.name, code=data.code, description=data.description
-        )
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    return await SourceRepository.create(
+        db_session, name=data.name, code=data.code, description=data.description
+    )
 
 
 @crm_router.post(
@@ -144,11 +135,8 @@ async def distribute_weights_for_source(
     :param db_session: сессия БД
     :return: сообщение
     """
-    try:
-        await WeightRepository.set_weights(db_session, source_id, weights)
-        return {"message": "ok"}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    await WeightRepository.set_weights(db_session, source_id, weights)
+    return {"message": "ok"}
 
 
 @crm_router.post(
@@ -160,22 +148,46 @@ async def distribute_weights_for_source(
 async def create_contact(
     data: ContactCreate,
     source_code: str,
-    db_session: AsyncSession = Depends(get_session_sync),
+    db_session: AsyncSession = Depends(get_session),
 ):
     """
     Эндпоинт, отвечающий за соблюдение бизнес логики маршрутизации обращений
     :param data: информацтя
-    :param db_session: синхронная сессия БД
+    :param db_session: асинхронная сессия БД
     :return: модель ContactOut
     """
     try:
-        contact_out = await ContactRepository.create(
+        return await ContactRepository.create(
             data,
             db_session,
             source_code,
         )
-        return contact_out
-    except Exception as e:
+    except ValueError as e:
+        # Источник с таким кодом не найден
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@crm_router.post(
+    "/contacts:batch",
+    response_model=List[ContactOut],
+    summary="Создать пакет обращений",
+    description="Эндпоинт пакетного создания обращений (код источника указывается в каждом обращении, "
+    f"не более {CONTACT_BATCH_MAX_SIZE} обращений в пакете)",
+)
+async def create_contacts_batch(
+    data: List[ContactBatchItem] = Body(..., max_length=CONTACT_BATCH_MAX_SIZE),
+    db_session: AsyncSession = Depends(get_session),
+):
+    """
+    Эндпоинт пакетной регистрации обращений с тем же алгоритмом маршрутизации
+    :param data: список обращений
+    :param db_session: асинхронная сессия БД
+    :return: список моделей ContactOut в порядке обращений
+    """
+    try:
+        return await ContactRepository.create_batch(data, db_session)
+    except ValueError as e:
+        # Источник с таким кодом не найден
         raise HTTPException(status_code=400, detail=str(e))
 
 
@@ -187,14 +199,25 @@ async def create_contact(
 )
 async def list_contacts(db_session: AsyncSession = Depends(get_session)):
     """
-    Эндпоинт для просмотра списка лидов и их обращений
+    Эндпоинт для просмотра списка лидов и их обращений.
+    JSON-массив отдается потоком по мере чтения строк из БД
     :param db_session: сессия БД
-    :return: список моделей LeadsAndContactsOut
+    :return: потоковый ответ со списком LeadsAndContactsOut
     """
-    try:
-        return await LeadRepository.get_leads_and_contacts(db_session)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+
+    # Генератор читает БД через сессию зависимости уже после выхода из эндпоинта.
+    # Это опирается на то, что FastAPI закрывает yield-зависимости после отправки ответа
+    # (так в 0.118+ и до 0.106; в 0.106-0.117 сессия закрывалась раньше) -
+    # версия FastAPI закреплена в requirements.txt
+    async def generate():
+        separator = b"["
+        async for chunk in LeadRepository.get_leads_and_contacts(db_session):
+            # orjson сериализует порцию целиком, квадратные скобки отрезаем
+            yield separator + orjson.dumps(chunk)[1:-1]
+            separator = b","
+        yield b"]" if separator == b"," else b"[]"
+
+    return StreamingResponse(generate(), media_type="application/json")
 
 
 @crm_router.get(
@@ -211,10 +234,7 @@ async def group_contacts_by_operators(
     :param db_session: сессия БД
     :return: список словарей с парами количество_контактов:идентификатор_оператора
     """
-    try:
-        return await ContactRepository.get_operator_stats(db_session)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    return await ContactRepository.get_operator_stats(db_session)
 
 
 @crm_router.get(
@@ -231,7 +251,4 @@ async def group_contacts_by_sources(
     :param db_session: сессия БД
     :return: список словарей с парами количество_контактов:идентификатор_источника
     """
-    try:
-        return await ContactRepository.get_source_stats(db_session)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    return await ContactRepository.get_source_stats(db_session)
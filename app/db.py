@@ -0,0 +1,136 @@
+from uuid import uuid4
+
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, StaticPool
+
+from app.schemas import Base
+from settings import settings
+
+"""
+Слой подключения к БД: движок, фабрика сессий и инициализация схемы
+"""
+
+
+database_url = make_url(settings.DATABASE_URL)
+backend_name = database_url.get_backend_name()
+
+# PRAGMA для SQLite: WAL позволяет читать параллельно с записью
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+
+engine_options = {}
+if backend_name == "postgresql" and settings.DB_USE_PGBOUNCER:
+    # PgBouncer сам держит пул; подготовленные выражения asyncpg
+    # несовместимы с его режимом транзакций, поэтому их кэш отключается
+    database_url = database_url.update_query_dict(
+        {"prepared_statement_cache_size": "0"}
+    )
+    engine_options = dict(
+        poolclass=NullPool,
+        connect_args={
+            "statement_cache_size": 0,
+            # Диалект все равно готовит выражения; уникальные имена исключают
+            # DuplicatePreparedStatementError на общих серверных соединениях PgBouncer
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        },
+    )
+elif backend_name == "postgresql":
+    # Для PostgreSQL (драйвер asyncpg) настраиваем пул соединений
+    engine_options = dict(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+elif backend_name == "sqlite":
+    # БД в памяти живет, пока открыто соединение, поэтому оно должно быть единственным
+    if database_url.database in (None, "", ":memory:"):
+        engine_options = dict(poolclass=StaticPool)
+    else:
+        engine_options = dict(poolclass=AsyncAdaptedQueuePool)
+
+engine = create_async_engine(database_url, echo=False, future=True, **engine_options)
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+
+# Опции соединения для транзакций, которые читают данные и пишут на их основе
+# (маршрутизация: проверка нагрузки оператора -> вставка обращения).
+# В SQLite такая транзакция открывается BEGIN IMMEDIATE и сразу берет блокировку записи,
+# поэтому параллельные маршрутизации (в т.ч. из других процессов) выполняются по очереди.
+# Другие СУБД опцию игнорируют
+WRITE_LOCK_OPTIONS = {"sqlite_begin_immediate": True}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Адаптер aiosqlite предоставляет синхронный DBAPI-интерфейс
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+    # Драйвер сам не выдает BEGIN перед SELECT; транзакциями управляет _begin_sqlite
+    dbapi_connection.isolation_level = None
+
+
+def _begin_sqlite(conn):
+    if conn.get_execution_options().get("sqlite_begin_immediate"):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conn.exec_driver_sql("BEGIN")
+
+
+if backend_name == "sqlite":
+    event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    event.listen(engine.sync_engine, "begin", _begin_sqlite)
+
+
+async def get_session() -> AsyncSession:
+    async with SessionLocal() as session:
+        yield session
+
+
+def _create_schema(sync_conn):
+    # Схема читается один раз; при "теплом" старте DDL не выполняется вовсе
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+    missing_tables = [
+        table
+        for table in Base.metadata.sorted_tables
+        if table.name not in existing_tables
+    ]
+    if missing_tables:
+        Base.metadata.create_all(sync_conn, tables=missing_tables, checkfirst=False)
+
+    # create_all не добавляет новые индексы в уже существующие таблицы
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {
+            index["name"] for index in inspector.get_indexes(table.name)
+        }
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(sync_conn)
+
+
+async def init_db():
+    """
+    Автоматически создавать таблицы и индексы базы данных, если они не существуют
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(_create_schema)
+
+
+async def close_db():
+    """
+    Закрыть соединения пула при остановке сервиса
+    """
+    await engine.dispose()
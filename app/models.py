@@ -1,7 +1,7 @@
 import datetime
 from enum import Enum
 from typing import Optional, Dict, Any
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr
 
 """
 Слой Pydantic моделей БД
@@ -33,13 +33,12 @@ class OperatorOut(BaseModel):
     Модель для вывода объекта таблицы operators
     """
 
-    id: int | None
-    name: str | None
-    is_active: bool | None
-    max_concurrent: int | None
+    id: int
+    name: str
+    is_active: bool
+    max_concurrent: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class SourceCreate(BaseModel):
@@ -62,8 +61,7 @@ class SourceOut(BaseModel):
     name: str
     description: Optional[str]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class LeadOut(BaseModel):
@@ -76,8 +74,7 @@ class LeadOut(BaseModel):
     phone: Optional[str]
     email: Optional[str]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class Status(Enum):
@@ -100,21 +97,32 @@ class ContactCreate(BaseModel):
     payload: Optional[Dict[str, Any]] = None
 
 
+# Максимальный размер пакета обращений: ограничивает длину списков IN в запросах пакета
+CONTACT_BATCH_MAX_SIZE = 500
+
+
+class ContactBatchItem(ContactCreate):
+    """
+    Модель обращения для пакетной регистрации: код источника указывается в каждом элементе
+    """
+
+    source_code: str = Field(..., min_length=1)
+
+
 class ContactOut(BaseModel):
     """
     Модель для вывода объекта таблицы contacts
     """
 
-    id: int | None
-    lead_id: int | None
-    source_id: int | None
-    operator_id: int | None
-    status: Status | None
+    id: int
+    lead_id: int
+    source_id: int
+    operator_id: Optional[int]
+    status: Status
     payload: Optional[Dict[str, Any]]
-    created_at: datetime.datetime | None = Field(default=datetime.datetime.utcnow())
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class OperatorSourceWeightCreate(BaseModel):
@@ -132,6 +140,8 @@ class LeadsAndContactsOut(BaseModel):
     Модель для отображения списка лидов и их обращений
     """
 
-    lead_phone: str
+    lead_phone: Optional[str]
     lead_id: int
     contact_id: int
+
+    model_config = ConfigDict(frozen=True)
@@ -3,48 +3,47 @@
 """
 Слой доступа к данным для службы ведущего маршрутизатора.
 Использует SQLAlchemy AsyncSession для операций с базой данных.
+Методы записи открывают транзакцию (async with session.begin()) только на этом,
+самом внешнем уровне - вложенных транзакций и SAVEPOINT нет.
 """
 
-from typing import List, Optional
-from sqlalchemy import select, func
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy.orm import Session, sessionmaker
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional
+from sqlalchemy import select, func, delete, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import WRITE_LOCK_OPTIONS
 from app.models import (
-    OperatorOut,
-    SourceOut,
     OperatorSourceWeightCreate,
-    ContactOut,
     OperatorUpdate,
     ContactCreate,
-    LeadsAndContactsOut,
+    ContactBatchItem,
 )
-from app.schemas import Operator, Lead, Source, OperatorSourceWeight, Base, Contact
-from settings import settings
-from app.services import RoutingService
-from sqlalchemy import create_engine
-
-
-engine = create_async_engine(settings.DATABASE_URL, echo=False, future=True)
-sync_engine = create_engine(
-    settings.DATABASE_URL.replace("+aiosqlite", ""), echo=False, future=True
-)
-SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-SyncSessionLocal = sessionmaker(
-    bind=sync_engine, autocommit=False, autoflush=False, class_=Session
+from app.schemas import Operator, Lead, Source, OperatorSourceWeight, Contact
+from app.services import RoutingService, SourceService
+
+
+# Размер порции строк при потоковой выдаче больших выборок
+STREAM_CHUNK_SIZE = 500
+
+# Запросы неизменной формы строятся один раз при импорте и переиспользуются
+_STMT_ALL_OPERATORS = select(Operator)
+_STMT_LEADS_AND_CONTACTS = (
+    select(
+        # Метки совпадают с полями LeadsAndContactsOut - строки отдаются словарями как есть
+        Lead.phone.label("lead_phone"),
+        Lead.id.label("lead_id"),
+        Contact.id.label("contact_id"),
+    )
+    .join(Contact, Lead.id == Contact.lead_id)
+    .execution_options(yield_per=STREAM_CHUNK_SIZE)
 )
-
-
-async def get_session() -> AsyncSession:
-    async with SessionLocal() as session:
-        yield session
-
-
-def get_session_sync() -> Session:
-    session = SyncSessionLocal()
-    try:
-        yield session
-    finally:
-        session.close()
+_STMT_OPERATOR_STATS = select(
+    func.count(Contact.id).label("contacts_count"),
+    Contact.operator_id.label("operator_id"),
+).group_by(Contact.operator_id)
+_STMT_SOURCE_STATS = select(
+    func.count(Contact.id).label("contacts_count"),
+    Contact.source_id.label("source_id"),
+).group_by(Contact.source_id)
 
 
 class OperatorRepository:
@@ -55,82 +54,66 @@ class OperatorRepository:
     @staticmethod
     async def create(
         db_session, name: str, is_active: bool, max_concurrent: int
-    ) -> OperatorOut:
+    ) -> Operator:
         """
         Функция создания оператора
         :param db_session: сессия БД
         :param name: имя оператора
         :param is_active: активен ли оператор
         :param max_concurrent: максимальная нагрузка оператора
-        :return: модель OperatorOut
+        :return: объект Operator (в OperatorOut его преобразует response_model эндпоинта)
         """
-        operator = Operator(
-            name=name, is_active=is_active, max_concurrent=max_concurrent
-        )
-        db_session.add(operator)
-        await db_session.commit()
-        operator_out = OperatorOut(
-            id=operator.id,
-            name=name,
-            is_active=is_active,
-            max_concurrent=max_concurrent,
+        # INSERT ... RETURNING возвращает строку за один запрос, без refresh
+        stmt = (
+            insert(Operator)
+            .values(name=name, is_active=is_active, max_concurrent=max_concurrent)
+            .returning(Operator)
         )
-
-        await db_session.refresh(operator)
-        return operator_out
+        async with db_session.begin():
+            operator = (await db_session.execute(stmt)).scalar_one()
+        return operator
 
     @staticmethod
-    async def get_all(db_session) -> List[OperatorOut]:
+    async def get_all(db_session) -> List[Operator]:
         """
-        Функция возврата всех операторов
+        Функция возврата всех операторов.
+        Валидацию в OperatorOut выполняет response_model эндпоинта (один раз на весь список)
         :param db_session: сессия БД
-        :return: список моделей OperatorOut
+        :return: список объектов Operator
         """
-        result = await db_session.execute(select(Operator))
-        list_of_operators = []
-        for o in result.scalars().all():
-            operator_out = OperatorOut(
-                id=o.id,
-                name=o.name,
-                is_active=o.is_active,
-                max_concurrent=o.max_concurrent,
-            )
-            list_of_operators.append(operator_out)
-        return list_of_operators
+        result = await db_session.execute(_STMT_ALL_OPERATORS)
+        return result.scalars().all()
 
     @staticmethod
     async def update(
         db_session: AsyncSession,
         data: OperatorUpdate,
         operator_id: Optional[int] = None,
-    ) -> OperatorOut:
+    ) -> Optional[Operator]:
         """
         Функция обновления конкретного оператора
         :param operator_id: идентификатор оператора
         :param db_session: сессия БД
         :param data: данные для обновления
-        :return: модель OperatorOut
+        :return: объект Operator или None, если оператор не найден
         """
-        db_operator = await db_session.get(Operator, operator_id)
-
-        if data.max_concurrent is not None:
-            db_operator.max_concurrent = data.max_concurrent
-        if data.is_active is not None:
-            db_operator.is_active = data.is_active
-        if data.name is not None:
-            db_operator.name = data.name
-        db_session.add(db_operator)
-        await db_session.commit()
-
-        operator_out = OperatorOut(
-            id=db_operator.id,
-            name=db_operator.name,
-            is_active=db_operator.is_active,
-            max_concurrent=db_operator.max_concurrent,
+        # Обновляются только переданные (не None) поля
+        values = data.model_dump(exclude_none=True)
+        if not values:
+            # Чтение тоже в явной транзакции: иначе открытый BEGIN висел бы на сессии до ее закрытия
+            async with db_session.begin():
+                return await db_session.get(Operator, operator_id)
+
+        # UPDATE ... RETURNING: изменение и чтение результата за один запрос
+        stmt = (
+            update(Operator)
+            .where(Operator.id == operator_id)
+            .values(**values)
+            .returning(Operator)
         )
-
-        await db_session.refresh(db_operator)
-        return operator_out
+        async with db_session.begin():
+            db_operator = (await db_session.execute(stmt)).scalar_one_or_none()
+        return db_operator
 
 
 class LeadRepository:
@@ -139,21 +122,20 @@ class LeadRepository:
     """
 
     @staticmethod
-    async def get_leads_and_contacts(db_session) -> List[LeadsAndContactsOut]:
-        stmt = select(
-            Lead.phone.label("leads_phone"),
-            Lead.id.label("leads_id"),
-            Contact.id.label("contacts_id"),
-        ).join(Contact, Lead.id == Contact.lead_id)
-        list_of_models = []
-        result = await db_session.execute(stmt)
-        rows = result.all()
-        for row in rows:
-            leads_and_models_model = LeadsAndContactsOut(
-                lead_phone=row[0], lead_id=row[1], contact_id=row[2]
-            )
-            list_of_models.append(leads_and_models_model)
-        return list_of_models
+    async def get_leads_and_contacts(
+        db_session,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Функция потоковой выдачи лидов и их обращений (один JOIN-запрос, серверный курсор).
+        Строки отдаются порциями, весь результат в памяти не накапливается
+        :param db_session: сессия БД
+        :return: асинхронный генератор списков словарей lead_phone/lead_id/contact_id
+        """
+        result = await db_session.stream(_STMT_LEADS_AND_CONTACTS)
+        async for rows in result.partitions():
+            # Данные из БД уже типизированы: ни валидация, ни Pydantic-модели не нужны,
+            # словари сразу сериализуются orjson
+            yield [row._asdict() for row in rows]
 
 
 class SourceRepository:
@@ -162,26 +144,24 @@ class SourceRepository:
     """
 
     @staticmethod
-    async def create(session_db, name: str, code: str, description: str) -> SourceOut:
+    async def create(session_db, name: str, code: str, description: str) -> Source:
         """
         Функция создания источника
         :param description: описание источника
         :param session_db: сессия БД
         :param name: названия источника
         :param code: уникальный идентификатор источника
-        :return: модель SourceOut
+        :return: объект Source
         """
-        source = Source(name=name, code=code, description=description)
-        session_db.add(source)
-        await session_db.commit()
-        source_out = SourceOut(
-            id=source.id,
-            code=source.code,
-            name=source.name,
-            description=source.description,
+        stmt = (
+            insert(Source)
+            .values(name=name, code=code, description=description)
+            .returning(Source)
         )
-        await session_db.refresh(source)
-        return source_out
+        async with session_db.begin():
+            source = (await session_db.execute(stmt)).scalar_one()
+        SourceService.invalidate(code)
+        return source
 
 
 class WeightRepository:
@@ -202,26 +182,22 @@ class WeightRepository:
         :param weights: список моделей OperatorSourceWeightCreate
         :return: None
         """
-        # Удаляем старые веса для источника source_id
-        result = await db_session.execute(
-            select(OperatorSourceWeight).where(
-                OperatorSourceWeight.source_id == source_id
-            )
-        )
-        for w in result.scalars().all():
-            await db_session.delete(w)
-
-        # Добавляем новые веса для источника source_id
-        for w in weights:
-            db_session.add(
-                OperatorSourceWeight(
-                    source_id=source_id,
-                    operator_id=w.operator_id,
-                    weight=w.weight,
+        values = [
+            {"source_id": source_id, "operator_id": w.operator_id, "weight": w.weight}
+            for w in weights
+        ]
+        # Удаление и вставка выполняются в одной транзакции (commit при выходе из блока)
+        async with db_session.begin():
+            # Удаляем старые веса для источника source_id одним запросом
+            await db_session.execute(
+                delete(OperatorSourceWeight).where(
+                    OperatorSourceWeight.source_id == source_id
                 )
             )
 
-        await db_session.commit()
+            # Добавляем новые веса для источника source_id одним executemany
+            if values:
+                await db_session.execute(insert(OperatorSourceWeight), values)
 
 
 class ContactRepository:
@@ -232,60 +208,69 @@ class ContactRepository:
     @staticmethod
     async def create(
         data: ContactCreate,
-        db_session,
+        db_session: AsyncSession,
         source_code: str,
-    ) -> ContactOut:
+    ) -> Contact:
         """
         Функция создания контакта
         :param source_code: уникальный строковый идентификатор источника
-        :param db_session: синхронная сессия БД
+        :param db_session: асинхронная сессия БД
         :param data: данные об обращении
-        :return: модель ContactOut
+        :return: объект Contact
         """
-        contact = RoutingService.route_and_create_contact(
-            db_session,
-            external_id=data.external_id,
-            phone=data.phone,
-            email=data.email,
-            source_code=source_code,
-            payload=data.payload,
-        )
+        # Поиск/создание лида и создание обращения фиксируются одним commit.
+        # Соединение берется с WRITE_LOCK_OPTIONS: в SQLite нагрузка операторов читается
+        # уже под блокировкой записи, и параллельные запросы не превышают max_concurrent
+        async with db_session.begin():
+            await db_session.connection(execution_options=WRITE_LOCK_OPTIONS)
+            contact = await RoutingService.route_and_create_contact(
+                db_session,
+                external_id=data.external_id,
+                phone=data.phone,
+                email=data.email,
+                source_code=source_code,
+                payload=data.payload,
+            )
 
-        contact_out = ContactOut(
-            id=contact.id,
-            lead_id=contact.lead_id,
-            source_id=contact.source_id,
-            operator_id=contact.operator_id,
-            status=contact.status,
-            payload=contact.payload,
-            created=contact.created_at,
-        )
-        return contact_out
+        return contact
 
     @staticmethod
-    async def get_operator_stats(db_session):
-        stmt = select(
-            func.count(Contact.id).label("contacts_count"),
-            Contact.operator_id.label("operator_id"),
-        ).group_by(Contact.operator_id)
-        result = await db_session.execute(stmt)
-        rows = result.mappings().all()
-        return rows
+    async def create_batch(
+        items: List[ContactBatchItem],
+        db_session: AsyncSession,
+    ) -> List[Contact]:
+        """
+        Функция пакетного создания контактов
+        :param items: список обращений с кодами источников
+        :param db_session: асинхронная сессия БД
+        :return: список объектов Contact
+        """
+        # Весь пакет фиксируется одним commit: либо создаются все обращения, либо ни одного.
+        # Как и в create, в SQLite транзакция сразу берет блокировку записи
+        async with db_session.begin():
+            await db_session.connection(execution_options=WRITE_LOCK_OPTIONS)
+            contacts = await RoutingService.route_and_create_contacts_batch(
+                db_session, items
+            )
 
-    @staticmethod
-    async def get_source_stats(db_session):
-        stmt = select(
-            func.count(Contact.id).label("contacts_count"),
-            Contact.source_id.label("source_id"),
-        ).group_by(Contact.source_id)
-        result = await db_session.execute(stmt)
-        rows = result.mappings().all()
-        return rows
+        return contacts
 
+    @staticmethod
+    async def get_operator_stats(db_session) -> List[Mapping[str, Optional[int]]]:
+        """
+        Функция подсчета обращений по операторам (GROUP BY на стороне БД)
+        :param db_session: сессия БД
+        :return: список словарей contacts_count/operator_id
+        """
+        result = await db_session.execute(_STMT_OPERATOR_STATS)
+        return result.mappings().all()
 
-async def init_db():
-    """
-    Автоматически создавать таблицы базы данных, если они не существуют
-    """
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    @staticmethod
+    async def get_source_stats(db_session) -> List[Mapping[str, Optional[int]]]:
+        """
+        Функция подсчета обращений по источникам (GROUP BY на стороне БД)
+        :param db_session: сессия БД
+        :return: список словарей contacts_count/source_id
+        """
+        result = await db_session.execute(_STMT_SOURCE_STATS)
+        return result.mappings().all()
@@ -1,14 +1,25 @@
-from fastapi import APIRouter
-from app.repository import init_db
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, FastAPI
+from app.db import SessionLocal, init_db, close_db
+from app.services import SourceService
 
 """
 Слой маршрутизатора сервиса
 """
 
 
-crm_router = APIRouter(tags=["Роутер CRM сервиса"])
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Жизненный цикл сервиса: создание таблиц и заполнение кэша источников при старте,
+    закрытие пула соединений при остановке
+    """
+    await init_db()
+    async with SessionLocal() as db_session:
+        await SourceService.warm_cache(db_session)
+    yield
+    await close_db()
 
 
-@crm_router.on_event("startup")
-async def startup_event():
-    await init_db()
+crm_router = APIRouter(tags=["Роутер CRM сервиса"], lifespan=lifespan)
@@ -8,6 +8,8 @@ from sqlalchemy import (
     ForeignKey,
     Float,
     Text,
+    Index,
+    text,
 )
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.types import JSON
@@ -23,14 +25,25 @@ Base = declarative_base()
 
 class OperatorSourceWeight(Base):
     __tablename__ = "operator_source_weights"
+    __table_args__ = (
+        # OperatorService.load_source_routing_table: WHERE source_id = ? + JOIN по operator_id.
+        # Составной PK начинается с operator_id и для поиска по источнику не подходит
+        Index("ix_operator_source_weights_source_operator", "source_id", "operator_id"),
+    )
+
     operator_id = Column(
         Integer, ForeignKey("operators.id", ondelete="CASCADE"), primary_key=True
     )
     source_id = Column(
-        Integer, ForeignKey("sources.id", ondelete="CASCADE"), primary_key=True
+        Integer,
+        ForeignKey("sources.id", ondelete="CASCADE"),
+        primary_key=True,
     )
     weight = Column(Float, nullable=False, default=0.0)  # 0 - оператор занят
 
+    operator = relationship("Operator", back_populates="source_weights")
+    source = relationship("Source", back_populates="source_weights")
+
 
 class Operator(Base):
     __tablename__ = "operators"
@@ -42,7 +55,7 @@ class Operator(Base):
 
     # Связь с таблицей sources через веса
     source_weights = relationship(
-        "OperatorSourceWeight", backref="operator", cascade="all, delete-orphan"
+        "OperatorSourceWeight", back_populates="operator", cascade="all, delete-orphan"
     )
 
     # Связь с таблицей contacts (backref from Contact.operator)
@@ -53,6 +66,7 @@ class Source(Base):
     __tablename__ = "sources"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
+    # Уникальный индекс по code - поиск в SourceService.get_source_id
     code = Column(
         String(100), unique=True, nullable=False
     )  # Уникальный идентификатор, например bot_telegram
@@ -60,7 +74,7 @@ class Source(Base):
     description = Column(Text, nullable=True)
 
     source_weights = relationship(
-        "OperatorSourceWeight", backref="source", cascade="all, delete-orphan"
+        "OperatorSourceWeight", back_populates="source", cascade="all, delete-orphan"
     )
     contacts = relationship("Contact", back_populates="source")
 
@@ -69,6 +83,7 @@ class Lead(Base):
     __tablename__ = "leads"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
+    # Индексы external_id, phone, email - поиск в LeadService.find_or_create_lead
     external_id = Column(
         String(200), nullable=True, index=True
     )  # внешний id от бота, если есть
@@ -81,16 +96,34 @@ class Lead(Base):
 
 class Contact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        # Нагрузка операторов (OperatorService.load_source_routing_table, get_operator_load,
+        # load_source_routing_slots, lock_operators): частичный индекс только по активным
+        # обращениям - закрытые в него не попадают
+        Index(
+            "ix_contacts_operator_id_active",
+            "operator_id",
+            "status",
+            postgresql_where=text("status IN ('assigned', 'in_progress')"),
+            sqlite_where=text("status IN ('assigned', 'in_progress')"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     lead_id = Column(
-        Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False
+        Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False, index=True
     )
     source_id = Column(
-        Integer, ForeignKey("sources.id", ondelete="SET NULL"), nullable=False
+        Integer,
+        ForeignKey("sources.id", ondelete="SET NULL"),
+        nullable=False,
+        index=True,
     )
     operator_id = Column(
-        Integer, ForeignKey("operators.id", ondelete="SET NULL"), nullable=True
+        Integer,
+        ForeignKey("operators.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
     )
     status = Column(
         String(50), nullable=False, default="new"
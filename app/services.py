@@ -1,27 +1,122 @@
-from sqlalchemy.orm import Session
-from typing import Optional, List, Dict
+from sqlalchemy import and_, bindparam, case, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List, Dict, Set, Tuple
 import random
+from collections import Counter
 from pydantic import EmailStr
 
 from app.schemas import Lead, Operator, Contact, Source, OperatorSourceWeight
-from app.models import LeadOut
+from app.models import ContactBatchItem
 
 """
 Бизнес-логика для маршрутизации CRM: идентификация потенциальных клиентов, доступность оператора,
 взвешенная маршрутизация и создание контактов.
 
-Предполагает синхронную работу SQLAlchemy и таблиц из schemas.py.
+Предполагает асинхронную работу SQLAlchemy (AsyncSession) и таблиц из schemas.py.
+Сервисы не фиксируют транзакцию сами (только flush) - commit выполняет вызывающий слой репозитория.
 """
 
 
+# Кэш соответствия code -> id источника. Источники не изменяются и не удаляются через API;
+# при старте сервиса кэш строится заново (warm_cache), чтобы после пересоздания или
+# восстановления БД не остались идентификаторы удаленных или перенумерованных источников
+_source_ids_by_code: Dict[str, int] = {}
+
+# Условие "обращение в работе" (нагрузка оператора). Статусы подставляются в SQL литералами,
+# чтобы планировщик мог использовать частичный индекс ix_contacts_operator_id_active
+_ACTIVE_CONTACT_STATUS = Contact.status.in_(
+    bindparam(
+        "active_statuses",
+        ["assigned", "in_progress"],
+        expanding=True,
+        literal_execute=True,
+    )
+)
+
+# Запросы неизменной формы строятся один раз при импорте; значения передаются через bindparam
+_STMT_SOURCE_ID_BY_CODE = select(Source.id).where(
+    Source.code == bindparam("source_code")
+)
+_STMT_SOURCE_IDS_BY_CODES = select(Source.code, Source.id).where(
+    Source.code.in_(bindparam("source_codes", expanding=True))
+)
+_STMT_ALL_SOURCE_IDS = select(Source.code, Source.id)
+
+# Нагрузка - количество активных обращений оператора (LEFT JOIN + GROUP BY).
+# Дальше используются только id и вес - остальные колонки не читаются
+_STMT_ROUTING_TABLE = (
+    select(Operator.id, OperatorSourceWeight.weight)
+    .join(OperatorSourceWeight, OperatorSourceWeight.operator_id == Operator.id)
+    .outerjoin(
+        Contact,
+        and_(Contact.operator_id == Operator.id, _ACTIVE_CONTACT_STATUS),
+    )
+    .where(
+        OperatorSourceWeight.source_id == bindparam("source_id"),
+        Operator.is_active.is_(True),
+    )
+    .group_by(Operator.id, OperatorSourceWeight.weight)
+    .having(func.count(Contact.id) < Operator.max_concurrent)
+)
+
+# Блокировка строки оператора. Нагрузка читается отдельным запросом уже после блокировки:
+# в READ COMMITTED подзапрос в том же SELECT ... FOR UPDATE видел бы снимок данных
+# до ожидания и не учел бы обращение, только что зафиксированное держателем блокировки
+_STMT_LOCK_OPERATOR = select(Operator.max_concurrent).where(
+    Operator.id == bindparam("operator_id"), Operator.is_active.is_(True)
+)
+_STMT_LOCK_OPERATOR_SKIP_LOCKED = _STMT_LOCK_OPERATOR.with_for_update(skip_locked=True)
+_STMT_LOCK_OPERATOR_WAIT = _STMT_LOCK_OPERATOR.with_for_update()
+_STMT_OPERATOR_LOAD = select(func.count(Contact.id)).where(
+    Contact.operator_id == bindparam("operator_id"), _ACTIVE_CONTACT_STATUS
+)
+# Пакетная маршрутизация: операторы источника и их свободные места читаются без блокировок;
+# блокируются затем только назначенные операторы - по возрастанию id и с ожиданием
+_STMT_ROUTING_SLOTS = (
+    select(
+        Operator.id,
+        OperatorSourceWeight.weight,
+        (Operator.max_concurrent - func.count(Contact.id)).label("free_slots"),
+    )
+    .join(OperatorSourceWeight, OperatorSourceWeight.operator_id == Operator.id)
+    .outerjoin(
+        Contact,
+        and_(Contact.operator_id == Operator.id, _ACTIVE_CONTACT_STATUS),
+    )
+    .where(
+        OperatorSourceWeight.source_id == bindparam("source_id"),
+        Operator.is_active.is_(True),
+    )
+    .group_by(Operator.id, OperatorSourceWeight.weight)
+    .having(func.count(Contact.id) < Operator.max_concurrent)
+)
+_STMT_LOCK_OPERATORS = (
+    select(Operator.id, Operator.max_concurrent)
+    .where(
+        Operator.id.in_(bindparam("operator_ids", expanding=True)),
+        Operator.is_active.is_(True),
+    )
+    .order_by(Operator.id)
+    .with_for_update()
+)
+_STMT_OPERATORS_LOAD = (
+    select(Contact.operator_id, func.count(Contact.id))
+    .where(
+        Contact.operator_id.in_(bindparam("operator_ids", expanding=True)),
+        _ACTIVE_CONTACT_STATUS,
+    )
+    .group_by(Contact.operator_id)
+)
+
+
 class LeadService:
     """
     Класс для осуществления бизнес логики определения лида
     """
 
     @staticmethod
-    def find_or_create_lead(
-        db_session: Session,
+    async def find_or_create_lead(
+        db_session: AsyncSession,
         external_id: str | None,
         phone: str | None,
         email: EmailStr | None,
@@ -32,20 +127,29 @@ class LeadService:
         :param external_id: идентификатор источника
         :param phone: номер телефона лида
         :param email: электронная почта
-        :return: модель LeadOut
+        :return: объект Lead
         """
-        query = db_session.query(Lead)
-        lead: Optional[Lead] = None
+        # Все признаки проверяются одним запросом; приоритет совпадения задает ORDER BY:
+        # external_id, затем телефон, затем эл. почта
+        conditions = []
+        priorities = []
+        for priority, (column, value) in enumerate(
+            ((Lead.external_id, external_id), (Lead.phone, phone), (Lead.email, email))
+        ):
+            if value:
+                conditions.append(column == value)
+                priorities.append((column == value, priority))
 
-        if external_id:
-            lead = query.filter(Lead.external_id == external_id).first()
-        if not lead and phone:
-            lead = query.filter(Lead.phone == phone).first()
-        if not lead and email:
-            lead = query.filter(Lead.email == email).first()
-
-        if lead:
-            return lead
+        if conditions:
+            stmt = (
+                select(Lead)
+                .where(or_(*conditions))
+                .order_by(case(*priorities, else_=len(priorities)), Lead.id)
+                .limit(1)
+            )
+            lead = (await db_session.execute(stmt)).scalar_one_or_none()
+            if lead:
+                return lead
 
         # Лида не нашли - создаем
         new_lead = Lead(
@@ -54,108 +158,233 @@ class LeadService:
             email=email,
         )
         db_session.add(new_lead)
-        db_session.commit()
-        new_lead_out = LeadOut(
-            id=new_lead.id,
-            external_id=new_lead.external_id,
-            phone=new_lead.phone,
-            email=new_lead.email,
-        )
-        db_session.refresh(new_lead)
-        return new_lead_out
+        # flush заполняет id; refresh не нужен - остальные поля уже заданы на объекте
+        await db_session.flush()
+        return new_lead
 
+    @staticmethod
+    async def find_or_create_leads(
+        db_session: AsyncSession, items: List[ContactBatchItem]
+    ) -> List[Lead]:
+        """
+        Функция пакетного поиска или создания лидов: один запрос на поиск и одна вставка новых.
+        Приоритет признаков тот же, что в find_or_create_lead; обращения одного нового лида
+        внутри пакета получают одного и того же лида
+        :param db_session: сессия БД
+        :param items: список обращений
+        :return: список объектов Lead в порядке обращений
+        """
+        fields = ("external_id", "phone", "email")
+        leads_by_key: Dict[Tuple[str, str], Lead] = {}
 
-class OperatorService:
+        conditions = []
+        for field in fields:
+            values = {getattr(item, field) for item in items if getattr(item, field)}
+            if values:
+                conditions.append(getattr(Lead, field).in_(values))
+
+        if conditions:
+            found = await db_session.scalars(
+                select(Lead).where(or_(*conditions)).order_by(Lead.id)
+            )
+            # При нескольких совпадениях по признаку побеждает лид с меньшим id
+            for lead in found:
+                for field in fields:
+                    value = getattr(lead, field)
+                    if value:
+                        leads_by_key.setdefault((field, value), lead)
+
+        leads = []
+        new_leads = []
+        for item in items:
+            keys = [(field, getattr(item, field)) for field in fields]
+            keys = [key for key in keys if key[1]]
+            lead = next(
+                (leads_by_key[key] for key in keys if key in leads_by_key), None
+            )
+            if lead is None:
+                # Лида не нашли - создаем и запоминаем для следующих обращений пакета
+                lead = Lead(
+                    external_id=item.external_id, phone=item.phone, email=item.email
+                )
+                new_leads.append(lead)
+                leads_by_key.update((key, lead) for key in keys)
+            leads.append(lead)
+
+        if new_leads:
+            db_session.add_all(new_leads)
+            # Новые лиды вставляются одним запросом (INSERT ... RETURNING id)
+            await db_session.flush()
+        return leads
+
+
+class SourceService:
     """
-    Класс для осуществления бизнес логики определения оператора
+    Класс для осуществления бизнес логики определения источника
     """
 
     @staticmethod
-    def get_operator_load(db: Session, operator_id: int) -> int:
+    async def get_source_id(db: AsyncSession, source_code: str) -> Optional[int]:
         """
-        Функция определения нагрузки оператора по его идентификатору
+        Функция определения идентификатора источника по его коду (с кэшированием в памяти)
         :param db: сессия БД
-        :param operator_id: идентификатор оператора
-        :return: Текущая нагрузка оператора
+        :param source_code: уникальный идентификатор источника
+        :return: идентификатор источника или None, если источник не найден
         """
-        return (
-            db.query(Contact)
-            .filter(
-                Contact.operator_id == operator_id,
-                Contact.status.in_(["assigned", "in_progress"]),
+        source_id = _source_ids_by_code.get(source_code)
+        if source_id is None:
+            source_id = await db.scalar(
+                _STMT_SOURCE_ID_BY_CODE, {"source_code": source_code}
             )
-            .count()
-        )
+            if source_id is not None:
+                _source_ids_by_code[source_code] = source_id
+        return source_id
 
     @staticmethod
-    def eligible_operators_for_source(db: Session, source: Source) -> List[Operator]:
+    async def get_source_ids(
+        db: AsyncSession, source_codes: Set[str]
+    ) -> Dict[str, int]:
         """
-        Приемлимые операторы для источника
+        Функция определения идентификаторов нескольких источников (отсутствующие в кэше - одним запросом)
         :param db: сессия БД
-        :param source: объект типа Source
-        :return: список операторов Operator
-        """
-        # Операторы, связанные с источниками через веса
-        links = (
-            db.query(OperatorSourceWeight)
-            .filter(OperatorSourceWeight.source_id == source.id)
-            .all()
-        )
-        operator_ids = [i.operator_id for i in links]
+        :param source_codes: множество уникальных идентификаторов источников
+        :return: словарь {код источника: идентификатор}; ненайденные источники в него не попадают
+        """
+        missing = source_codes - _source_ids_by_code.keys()
+        if missing:
+            rows = await db.execute(
+                _STMT_SOURCE_IDS_BY_CODES, {"source_codes": list(missing)}
+            )
+            _source_ids_by_code.update(rows.tuples().all())
+        return {
+            code: _source_ids_by_code[code]
+            for code in source_codes
+            if code in _source_ids_by_code
+        }
 
-        if not operator_ids:
-            return []
+    @staticmethod
+    async def warm_cache(db: AsyncSession) -> None:
+        """
+        Функция заполнения кэша идентификаторов всеми источниками из БД (при старте сервиса).
+        Прежнее содержимое кэша отбрасывается. Источники, созданные позже другими процессами,
+        подгружаются по промаху кэша
+        :param db: сессия БД
+        """
+        rows = (await db.execute(_STMT_ALL_SOURCE_IDS)).tuples().all()
+        _source_ids_by_code.clear()
+        _source_ids_by_code.update(rows)
 
-        ops = db.query(Operator).filter(Operator.id.in_(operator_ids)).all()
+    @staticmethod
+    def invalidate(source_code: str) -> None:
+        """
+        Функция сброса закэшированного идентификатора источника
+        :param source_code: уникальный идентификатор источника
+        """
+        _source_ids_by_code.pop(source_code, None)
 
-        # Фильтруем активных и с нагрузкой, которая меньше максимальной
-        eligible = []
-        for op in ops:
-            if not op.is_active:
-                continue
-            load = OperatorService.get_operator_load(db, op.id)
-            if load < op.max_concurrent:
-                eligible.append(op)
-        return eligible
+
+class OperatorService:
+    """
+    Класс для осуществления бизнес логики определения оператора
+    """
 
     @staticmethod
-    def get_weights_for_source(db: Session, source: Source) -> Dict[int, float]:
+    async def load_source_routing_table(
+        db: AsyncSession, source_id: int
+    ) -> List[Tuple[int, float]]:
         """
-        Функция возврата операторов и их весов по отношению к источнику
+        Функция возврата приемлимых операторов источника вместе с их весами.
+        Связь с источником, вес, активность и текущая нагрузка читаются одним запросом
         :param db: сессия БД
-        :param source: источник
-        :return: словарь с идентификатором операторов и их весов
+        :param source_id: идентификатор источника
+        :return: список пар (идентификатор оператора, вес оператора по источнику)
         """
-        rows = (
-            db.query(OperatorSourceWeight)
-            .filter(OperatorSourceWeight.source_id == source.id)
-            .all()
-        )
-        return {r.operator_id: r.weight for r in rows}
+        result = await db.execute(_STMT_ROUTING_TABLE, {"source_id": source_id})
+        return result.tuples().all()
+
+    @staticmethod
+    async def lock_operator(
+        db: AsyncSession, operator_id: int, wait: bool = False
+    ) -> Optional[int]:
+        """
+        Функция блокировки строки активного оператора до конца транзакции.
+        По умолчанию SELECT ... FOR UPDATE SKIP LOCKED: оператор, которого прямо сейчас
+        назначает параллельный запрос, пропускается; при wait=True блокировка ожидается.
+        В SQLite блокировку записи берет вся транзакция (см. app.db.WRITE_LOCK_OPTIONS)
+        :param db: сессия БД
+        :param operator_id: идентификатор оператора
+        :param wait: ожидать блокировку вместо пропуска
+        :return: лимит нагрузки оператора или None, если оператор занят или неактивен
+        """
+        stmt = _STMT_LOCK_OPERATOR_WAIT if wait else _STMT_LOCK_OPERATOR_SKIP_LOCKED
+        return await db.scalar(stmt, {"operator_id": operator_id})
+
+    @staticmethod
+    async def get_operator_load(db: AsyncSession, operator_id: int) -> int:
+        """
+        Функция определения нагрузки оператора (количество активных обращений)
+        :param db: сессия БД
+        :param operator_id: идентификатор оператора
+        :return: текущая нагрузка оператора
+        """
+        return await db.scalar(_STMT_OPERATOR_LOAD, {"operator_id": operator_id})
+
+    @staticmethod
+    async def load_source_routing_slots(
+        db: AsyncSession, source_id: int
+    ) -> List[Tuple[int, float, int]]:
+        """
+        Функция возврата приемлимых операторов источника с весами и свободными местами
+        (без блокировок) для пакетного распределения
+        :param db: сессия БД
+        :param source_id: идентификатор источника
+        :return: список троек (идентификатор оператора, вес, количество свободных мест)
+        """
+        result = await db.execute(_STMT_ROUTING_SLOTS, {"source_id": source_id})
+        return result.tuples().all()
+
+    @staticmethod
+    async def lock_operators(
+        db: AsyncSession, operator_ids: Set[int]
+    ) -> Dict[int, int]:
+        """
+        Функция блокировки нескольких операторов до конца транзакции (по возрастанию id,
+        с ожиданием) и пересчета их свободных мест уже после блокировки
+        :param db: сессия БД
+        :param operator_ids: множество идентификаторов операторов
+        :return: словарь {идентификатор оператора: свободные места}; неактивные не попадают
+        """
+        params = {"operator_ids": sorted(operator_ids)}
+        limits = dict((await db.execute(_STMT_LOCK_OPERATORS, params)).tuples().all())
+        loads = dict((await db.execute(_STMT_OPERATORS_LOAD, params)).tuples().all())
+        return {
+            operator_id: max_concurrent - loads.get(operator_id, 0)
+            for operator_id, max_concurrent in limits.items()
+        }
 
     @staticmethod
     def choose_operator_weighted(
-        eligible: List[Operator], weights: Dict[int, float]
-    ) -> Optional[Operator]:
+        routing_table: List[Tuple[int, float]],
+    ) -> Optional[int]:
         """
         Функция подбора оператора
-        :param eligible: список подходящих операторов
-        :param weights: словарь {идентификатор оператора:вес}
-        :return: наиболее подходящий оператор (модель OperatorOut)
+        :param routing_table: список пар (идентификатор подходящего оператора, вес)
+        :return: идентификатор наиболее подходящего оператора
         """
-        if not eligible:
+        if not routing_table:
             return None
 
-        # Извлекаем веса из списка подходящих операторов.
-        ops_and_weights = {op.id: weights.get(op.id, 0) for op in eligible}
-        total = sum(ops_and_weights.values())
-        if total <= 0:
+        # A-Res: у каждого оператора ключ u ** (1 / w), побеждает максимальный.
+        # Один проход без накопленных сумм и нормировки; нулевые веса не участвуют
+        chosen = max(
+            ((op_id, weight) for op_id, weight in routing_table if weight > 0),
+            key=lambda pair: random.random() ** (1.0 / pair[1]),
+            default=None,
+        )
+        if chosen is None:
             # Равномерное распределение
-            return random.choice(eligible)
-
-        operators = eligible
-        probs = [ops_and_weights[op.id] / total for op in operators]
-        return random.choices(operators, weights=probs, k=1)[0]
+            return random.choice(routing_table)[0]
+        return chosen[0]
 
 
 class ContactService:
@@ -164,44 +393,63 @@ class ContactService:
     """
 
     @staticmethod
-    def create_contact(
-        db: Session,
+    async def create_contact(
+        db: AsyncSession,
         lead: Lead,
-        source: Source,
-        operator: Optional[Operator],
+        source_id: int,
+        operator_id: Optional[int],
         payload: dict | None,
     ) -> Contact:
         """
         Функция создания обращения
         :param db: сессия БД
         :param lead: Лид
-        :param source: Источник
-        :param operator: Оператор
+        :param source_id: идентификатор источника
+        :param operator_id: идентификатор оператора или None
         :param payload: содержимое обращения
         :return: Модель обращения ContactOut
         """
         contact = Contact(
             lead_id=lead.id,
-            source_id=source.id,
-            operator_id=operator.id if operator else None,
-            status="assigned" if operator else "new",
+            source_id=source_id,
+            operator_id=operator_id,
+            status="assigned" if operator_id is not None else "new",
             payload=payload or {},
         )
 
         db.add(contact)
-        db.commit()
-        db.refresh(contact)
+        # id и Python-умолчания (created_at) заполняются при flush, refresh не нужен
+        await db.flush()
         return contact
 
+    @staticmethod
+    async def create_contacts(db: AsyncSession, rows: List[dict]) -> List[Contact]:
+        """
+        Функция пакетного создания обращений одним INSERT ... RETURNING
+        :param db: сессия БД
+        :param rows: список словарей с колонками обращений
+        :return: список объектов Contact в порядке rows
+        """
+        # render_nulls: строки с operator_id = None не дробят пакет на отдельные INSERT
+        stmt = (
+            insert(Contact)
+            .returning(Contact, sort_by_parameter_order=True)
+            .execution_options(render_nulls=True)
+        )
+        result = await db.scalars(stmt, rows)
+        return result.all()
+
 
 class RoutingService:
     """
-    Главный класс для осуществления бизнес логики маршрутизации обращения
+    Главный класс для осуществления бизнес логики маршрутизации обращения.
+    Не должен открывать собственную транзакцию (begin/commit/begin_nested):
+    границу транзакции задает ContactRepository.create
     """
 
     @staticmethod
-    def route_and_create_contact(
-        db_session: Session,
+    async def route_and_create_contact(
+        db_session: AsyncSession,
         external_id: str | None,
         phone: str | None,
         email: EmailStr | None,
@@ -219,7 +467,7 @@ class RoutingService:
         :return: объект-обращение Contact
         """
         # 1. Идентифицируем лида
-        lead = LeadService.find_or_create_lead(
+        lead = await LeadService.find_or_create_lead(
             db_session,
             external_id=external_id,
             phone=phone,
@@ -227,22 +475,125 @@ class RoutingService:
         )
 
         # 2. Определяем источник
-        source = db_session.query(Source).filter(Source.code == source_code).first()
-        if not source:
+        source_id = await SourceService.get_source_id(db_session, source_code)
+        if source_id is None:
             raise ValueError(f"Источник не найден: {source_code}")
 
         # 3. Подходящие оператора
-        eligible = OperatorService.eligible_operators_for_source(db_session, source)
-        weights = OperatorService.get_weights_for_source(db_session, source)
+        routing_table = await OperatorService.load_source_routing_table(
+            db_session, source_id
+        )
 
-        # 4. Распределение весов и получение соответствующего оператора
-        operator = OperatorService.choose_operator_weighted(eligible, weights)
+        # 4. Распределение весов и получение соответствующего оператора.
+        # Выбранный оператор блокируется до commit, затем проверяется его нагрузка;
+        # если он занят параллельным запросом или лимит исчерпан - исключаем и выбираем заново
+        operator_id = None
+        holds_locks = False
+        while routing_table:
+            candidate = OperatorService.choose_operator_weighted(routing_table)
+            # Последнего кандидата ждем, а не пропускаем: иначе при кратковременной
+            # блокировке всех операторов обращение осталось бы без назначения.
+            # Не ждем, если уже держим блокировки других операторов - возможна взаимоблокировка
+            wait = len(routing_table) == 1 and not holds_locks
+            max_concurrent = await OperatorService.lock_operator(
+                db_session, candidate, wait=wait
+            )
+            if max_concurrent is not None:
+                holds_locks = True
+                load = await OperatorService.get_operator_load(db_session, candidate)
+                if load < max_concurrent:
+                    operator_id = candidate
+                    break
+            routing_table = [pair for pair in routing_table if pair[0] != candidate]
 
         # 5. Создание обращения (оператор может быть None)
-        return ContactService.create_contact(
+        return await ContactService.create_contact(
             db_session,
             lead=lead,
-            source=source,
-            operator=operator,
+            source_id=source_id,
+            operator_id=operator_id,
             payload=payload,
         )
+
+    @staticmethod
+    async def route_and_create_contacts_batch(
+        db_session: AsyncSession, items: List[ContactBatchItem]
+    ) -> List[Contact]:
+        """
+        Функция, создающая и маршрутизирующая пакет обращений.
+        Число запросов не зависит от размера пакета: лиды ищутся и создаются разом,
+        операторы читаются одним запросом на источник, назначенные операторы блокируются
+        разом, обращения вставляются разом
+        :param db_session: сессия БД
+        :param items: список обращений с кодами источников
+        :return: список объектов-обращений Contact в порядке items
+        """
+        if not items:
+            return []
+
+        # 1. Определяем источники; неизвестный источник отклоняет весь пакет
+        source_codes = {item.source_code for item in items}
+        source_ids = await SourceService.get_source_ids(db_session, source_codes)
+        unknown = sorted(source_codes - source_ids.keys())
+        if unknown:
+            raise ValueError(f"Источник не найден: {', '.join(unknown)}")
+
+        # 2. Идентифицируем лидов
+        leads = await LeadService.find_or_create_leads(db_session, items)
+
+        # 3. Подходящие операторы и их свободные места - по одному запросу на источник
+        routing_tables: Dict[int, List[Tuple[int, float]]] = {}
+        free_slots: Dict[int, int] = {}
+        for source_id in sorted(set(source_ids.values())):
+            rows = await OperatorService.load_source_routing_slots(
+                db_session, source_id
+            )
+            routing_tables[source_id] = [(op_id, weight) for op_id, weight, _ in rows]
+            free_slots.update((op_id, free) for op_id, _, free in rows)
+
+        # 4. Распределение с учетом нагрузки, набранной внутри пакета
+        contact_rows = []
+        for item, lead in zip(items, leads):
+            source_id = source_ids[item.source_code]
+            operator_id = OperatorService.choose_operator_weighted(
+                routing_tables[source_id]
+            )
+            if operator_id is not None:
+                free_slots[operator_id] -= 1
+                if free_slots[operator_id] == 0:
+                    # Лимит исчерпан - оператор выбывает из всех источников пакета
+                    for table_source_id, table in routing_tables.items():
+                        routing_tables[table_source_id] = [
+                            pair for pair in table if pair[0] != operator_id
+                        ]
+            contact_rows.append(
+                {
+                    "lead_id": lead.id,
+                    "source_id": source_id,
+                    "operator_id": operator_id,
+                    "status": "assigned" if operator_id is not None else "new",
+                    "payload": item.payload or {},
+                }
+            )
+
+        # 5. Блокируем только назначенных операторов и перепроверяем их свободные места:
+        # пока пакет распределялся, параллельные запросы могли занять часть мест.
+        # Обращения сверх оставшихся мест создаются без назначения
+        assigned = Counter(
+            row["operator_id"] for row in contact_rows if row["operator_id"] is not None
+        )
+        if assigned:
+            locked_slots = await OperatorService.lock_operators(
+                db_session, set(assigned)
+            )
+            for row in reversed(contact_rows):
+                operator_id = row["operator_id"]
+                if operator_id is None:
+                    continue
+                if assigned[operator_id] > locked_slots.get(operator_id, 0):
+                    assigned[operator_id] -= 1
+                    row["operator_id"] = None
+                    row["status"] = "new"
+
+        # 6. Создание обращений одним запросом
+        return await ContactService.create_contacts(db_session, contact_rows)
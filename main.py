@@ -1,23 +1,93 @@
-from fastapi import FastAPI
+import logging
+import os
+import sys
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from uvicorn import run
 from app.controllers import crm_router
+from settings import settings
 
 """
 Слой запуска приложения
 """
 
+logger = logging.getLogger(__name__)
+
 
-app = FastAPI(title="FastAPI CRM")
+app = FastAPI(title="FastAPI CRM", default_response_class=ORJSONResponse)
 
 app.include_router(crm_router)
 
 
+def _driver_message(exc: SQLAlchemyError) -> str:
+    """
+    Первая строка сообщения драйвера БД - без SQL и значений параметров
+    (для PostgreSQL отбрасывается и строка DETAIL со значениями ключа)
+    """
+    orig = getattr(exc, "orig", None)
+    message = str(orig).splitlines()[0] if orig is not None else type(exc).__name__
+    # Адаптер asyncpg добавляет перед текстом класс исключения драйвера
+    return message.split(">: ", 1)[-1]
+
+
+def _constraint_name(exc: IntegrityError) -> Optional[str]:
+    """
+    Имя нарушенного ограничения: asyncpg сообщает его в исходном исключении драйвера,
+    SQLite - нет (таблица и колонка уже есть в тексте сообщения)
+    """
+    return getattr(getattr(exc.orig, "__cause__", None), "constraint_name", None)
+
+
+@app.exception_handler(SQLAlchemyError)
+async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
+    """
+    Единая обработка ошибок БД: нарушение ограничений - 400, остальное - 500.
+    Текст исключения содержит SQL и параметры (телефон, email, payload лида),
+    поэтому ни клиенту, ни в лог уровня warning/error он не попадает -
+    полностью исключение пишется только на уровне debug
+    """
+    if isinstance(exc, IntegrityError):
+        message = _driver_message(exc)
+        logger.warning(
+            "Нарушено ограничение БД %s: %s %s: %s",
+            _constraint_name(exc) or "-",
+            request.method,
+            request.url.path,
+            message,
+        )
+        logger.debug("Ошибка БД: %s %s", request.method, request.url.path, exc_info=exc)
+        return ORJSONResponse(
+            status_code=400,
+            content={"detail": f"Нарушено ограничение БД: {message}"},
+        )
+
+    logger.error(
+        "Ошибка БД: %s %s: %s", request.method, request.url.path, _driver_message(exc)
+    )
+    logger.debug("Ошибка БД: %s %s", request.method, request.url.path, exc_info=exc)
+    return ORJSONResponse(status_code=500, content={"detail": "Внутренняя ошибка БД"})
+
+
 # Для локального запуска сервиса без Docker/Docker Compose
 if __name__ == "__main__":
+    if settings.APP_ENV == "dev":
+        run_options = dict(reload=True, log_level="debug")
+    else:
+        # Без перезагрузчика и отладочного логирования, по воркеру на ядро
+        run_options = dict(
+            reload=False,
+            log_level="warning",
+            workers=min(os.cpu_count() or 1, 8),
+            http="httptools",
+        )
     run(
         app="main:app",
-        reload=True,
-        log_level="debug",
         host="localhost",
         port=8000,
+        # uvloop недоступен под Windows
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        **run_options,
     )
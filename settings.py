@@ -1,30 +1,30 @@
-from functools import lru_cache
-from typing import Annotated
-
-from fastapi import Depends
 from pydantic_settings import BaseSettings, SettingsConfigDict
-import os
+from pathlib import Path
 
 """
 Слой настроек pydantic-settings
 """
 
 
-class Settings(BaseSettings):
-    DATABASE_URL: str
-
-    model_config = SettingsConfigDict(
-        env_file=f"{os.path.dirname(os.path.abspath(__file__))}/.env"
-    )
+# Путь к .env вычисляется один раз при импорте модуля
+_ENV_FILE = (Path(__file__).parent / ".env").resolve()
 
 
-settings = Settings()
+class Settings(BaseSettings):
+    DATABASE_URL: str
+    # Окружение запуска: "dev" - автоперезагрузка и отладочные логи
+    APP_ENV: str = "dev"
 
+    # Пул соединений к PostgreSQL
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 3600
+    # Пулом управляет PgBouncer - на стороне приложения пул не используется
+    DB_USE_PGBOUNCER: bool = False
 
-@lru_cache()
-def get_settings():
-    return settings
+    model_config = SettingsConfigDict(env_file=_ENV_FILE)
 
 
-# Аннотированный тип для эндпоинтов
-SettingsDep = Annotated[Settings, Depends(get_settings)]
+# Единственный экземпляр настроек на процесс: .env читается один раз
+settings = Settings()
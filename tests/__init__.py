@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Отдельная файловая БД SQLite задается до импорта приложения: движок создается при импорте.
+# Пакет tests импортируется раньше любого тестового модуля, поэтому порядок импортов в них не важен
+_DB_DIR = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB_DIR.name}/test.db"
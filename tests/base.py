@@ -0,0 +1,58 @@
+import unittest
+
+import httpx
+
+from app.db import engine
+from app.schemas import Base
+from app.services import _source_ids_by_code
+from main import app
+
+"""
+Общая основа тестов API: пустая БД и HTTP-клиент к приложению на каждый тест
+"""
+
+
+class ApiTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    Базовый класс тестов: таблицы пересоздаются, сервис запускается через lifespan
+    """
+
+    async def asyncSetUp(self):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        # Кэш источников живет на уровне процесса - между тестами он не должен переноситься
+        _source_ids_by_code.clear()
+        await self.enterAsyncContext(app.router.lifespan_context(app))
+        transport = httpx.ASGITransport(app=app)
+        self.client = await self.enterAsyncContext(
+            httpx.AsyncClient(transport=transport, base_url="http://test")
+        )
+
+    async def _create_operator(self, name: str, max_concurrent: int = 5) -> int:
+        response = await self.client.post(
+            "/operators", json={"name": name, "max_concurrent": max_concurrent}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["id"]
+
+    async def _create_source(self, code: str, weights: dict | None = None) -> int:
+        """
+        Источник с весами операторов {operator_id: weight}
+        """
+        response = await self.client.post("/sources", json={"code": code, "name": code})
+        self.assertEqual(response.status_code, 200)
+        source_id = response.json()["id"]
+        if weights:
+            response = await self.client.post(
+                f"/sources/{source_id}",
+                json=[
+                    {"operator_id": op_id, "source_id": source_id, "weight": weight}
+                    for op_id, weight in weights.items()
+                ],
+            )
+            self.assertEqual(response.status_code, 200)
+        return source_id
+
+    async def _operator_loads(self) -> dict:
+        response = await self.client.get("/contacts_by_operators")
+        return {row["operator_id"]: row["contacts_count"] for row in response.json()}
@@ -0,0 +1,57 @@
+import unittest
+
+from tests.base import ApiTestCase
+
+"""
+Тесты потоковой выдачи /contacts_and_leads
+"""
+
+
+class ContactsAndLeadsStreamTest(ApiTestCase):
+    """
+    Потоковый ответ должен быть корректным JSON-массивом
+    """
+
+    async def test_empty_stream_is_json_array(self):
+        response = await self.client.get("/contacts_and_leads")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertEqual(response.json(), [])
+
+    async def test_stream_returns_all_rows(self):
+        await self._create_source("tg")
+        for phone in ("+7000", "+7001", "+7000"):
+            response = await self.client.post("/contacts/tg", json={"phone": phone})
+            self.assertEqual(response.status_code, 200)
+
+        response = await self.client.get("/contacts_and_leads")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(response.json(), key=lambda row: row["contact_id"]),
+            [
+                {"lead_phone": "+7000", "lead_id": 1, "contact_id": 1},
+                {"lead_phone": "+7001", "lead_id": 2, "contact_id": 2},
+                {"lead_phone": "+7000", "lead_id": 1, "contact_id": 3},
+            ],
+        )
+
+    async def test_stream_joins_several_chunks(self):
+        await self._create_source("tg")
+        # Больше STREAM_CHUNK_SIZE строк - массив собирается из нескольких порций
+        batch = [{"source_code": "tg", "phone": "+7000"}] * 300
+        for _ in range(2):
+            response = await self.client.post("/contacts:batch", json=batch)
+            self.assertEqual(response.status_code, 200)
+
+        response = await self.client.get("/contacts_and_leads")
+
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()
+        self.assertEqual(len(rows), 600)
+        self.assertEqual({row["contact_id"] for row in rows}, set(range(1, 601)))
+
+
+if __name__ == "__main__":
+    unittest.main()
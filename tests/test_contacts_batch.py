@@ -0,0 +1,160 @@
+import unittest
+
+from sqlalchemy import func, select
+
+from app.db import SessionLocal
+from app.models import CONTACT_BATCH_MAX_SIZE
+from app.schemas import Contact, Lead
+from app.services import LeadService
+from tests.base import ApiTestCase
+
+"""
+Тесты пакетной регистрации обращений POST /contacts:batch
+"""
+
+
+class ContactsBatchTest(ApiTestCase):
+    """
+    Пакет маршрутизируется так же, как одиночные обращения, и фиксируется целиком
+    """
+
+    async def _count(self, model) -> int:
+        async with SessionLocal() as db_session:
+            return await db_session.scalar(select(func.count(model.id)))
+
+    async def test_unknown_source_rejects_whole_batch(self):
+        await self._create_source("tg")
+
+        response = await self.client.post(
+            "/contacts:batch",
+            json=[
+                {"source_code": "tg", "phone": "+7000"},
+                {"source_code": "nope", "phone": "+7001"},
+            ],
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "Источник не найден: nope"})
+        self.assertEqual(await self._count(Contact), 0)
+        self.assertEqual(await self._count(Lead), 0)
+
+    async def test_same_new_phone_creates_one_lead(self):
+        await self._create_source("tg")
+
+        response = await self.client.post(
+            "/contacts:batch",
+            json=[
+                {"source_code": "tg", "phone": "+7000"},
+                {"source_code": "tg", "phone": "+7001"},
+                {"source_code": "tg", "phone": "+7000"},
+            ],
+        )
+
+        self.assertEqual(response.status_code, 200)
+        lead_ids = [contact["lead_id"] for contact in response.json()]
+        self.assertEqual(lead_ids[0], lead_ids[2])
+        self.assertNotEqual(lead_ids[0], lead_ids[1])
+        self.assertEqual(await self._count(Lead), 2)
+
+    async def test_lead_priority_matches_single_lookup(self):
+        await self._create_source("tg")
+        async with SessionLocal() as db_session, db_session.begin():
+            leads = [
+                Lead(email="a@example.com"),
+                Lead(phone="+7000"),
+                Lead(external_id="tg-1"),
+                Lead(phone="+7001"),
+                Lead(phone="+7001"),
+            ]
+            db_session.add_all(leads)
+        items = [
+            {"external_id": "tg-1", "phone": "+7000", "email": "a@example.com"},
+            {"external_id": "tg-2", "phone": "+7000", "email": "a@example.com"},
+            {"external_id": "tg-2", "phone": "+7999", "email": "a@example.com"},
+            {"phone": "+7001"},
+        ]
+
+        response = await self.client.post(
+            "/contacts:batch", json=[dict(item, source_code="tg") for item in items]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        batch_lead_ids = [contact["lead_id"] for contact in response.json()]
+        self.assertEqual(
+            batch_lead_ids, [leads[2].id, leads[1].id, leads[0].id, leads[3].id]
+        )
+        async with SessionLocal() as db_session:
+            for item, lead_id in zip(items, batch_lead_ids):
+                lead = await LeadService.find_or_create_lead(
+                    db_session,
+                    external_id=item.get("external_id"),
+                    phone=item.get("phone"),
+                    email=item.get("email"),
+                )
+                self.assertEqual(lead.id, lead_id)
+        self.assertEqual(await self._count(Lead), len(leads))
+
+    async def test_full_operator_leaves_other_sources_of_batch(self):
+        shared = await self._create_operator("shared", max_concurrent=1)
+        spare = await self._create_operator("spare", max_concurrent=10)
+        await self._create_source("first", {shared: 1})
+        # Пока у shared есть место, он выбирается почти всегда
+        await self._create_source("second", {shared: 1_000_000, spare: 1})
+
+        response = await self.client.post(
+            "/contacts:batch",
+            json=[{"source_code": "first"}] + [{"source_code": "second"}] * 3,
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [contact["operator_id"] for contact in response.json()],
+            [shared, spare, spare, spare],
+        )
+
+    async def test_response_follows_input_order(self):
+        operator_id = await self._create_operator("A", max_concurrent=2)
+        first = await self._create_source("first", {operator_id: 1})
+        second = await self._create_source("second")
+        items = [
+            {"source_code": code, "phone": f"+700{i}", "payload": {"n": i}}
+            for i, code in enumerate(["second", "first", "second", "first", "first"])
+        ]
+
+        response = await self.client.post("/contacts:batch", json=items)
+
+        self.assertEqual(response.status_code, 200)
+        contacts = response.json()
+        self.assertEqual([c["payload"] for c in contacts], [{"n": i} for i in range(5)])
+        self.assertEqual(
+            [c["source_id"] for c in contacts], [second, first, second, first, first]
+        )
+        # Третье обращение в "first" превышает лимит оператора и остается без назначения
+        self.assertEqual(
+            [(c["operator_id"], c["status"]) for c in contacts],
+            [
+                (None, "new"),
+                (operator_id, "assigned"),
+                (None, "new"),
+                (operator_id, "assigned"),
+                (None, "new"),
+            ],
+        )
+        self.assertEqual([c["id"] for c in contacts], sorted(c["id"] for c in contacts))
+
+    async def test_batch_over_limit_is_rejected(self):
+        await self._create_source("tg")
+        batch = [{"source_code": "tg"}] * (CONTACT_BATCH_MAX_SIZE + 1)
+
+        response = await self.client.post("/contacts:batch", json=batch)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(await self._count(Contact), 0)
+
+        response = await self.client.post("/contacts:batch", json=batch[1:])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), CONTACT_BATCH_MAX_SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
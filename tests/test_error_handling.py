@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+
+from sqlalchemy.exc import OperationalError
+
+from tests.base import ApiTestCase
+
+"""
+Тесты обработки ошибок БД: клиенту и в лог warning/error не попадают SQL и параметры
+"""
+
+
+class ErrorHandlingTest(ApiTestCase):
+    """
+    Единый обработчик SQLAlchemyError и ответ 404 для отсутствующего оператора
+    """
+
+    async def test_integrity_error_returns_sanitized_400(self):
+        await self._create_source("tg")
+
+        with self.assertLogs("main", level="DEBUG") as logs:
+            response = await self.client.post(
+                "/sources",
+                json={"code": "tg", "name": "secret-name", "description": "secret"},
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {
+                "detail": "Нарушено ограничение БД: UNIQUE constraint failed: sources.code"
+            },
+        )
+        warnings = [r.getMessage() for r in logs.records if r.levelname == "WARNING"]
+        self.assertEqual(len(warnings), 1)
+        self.assertIn("UNIQUE constraint failed: sources.code", warnings[0])
+        self.assertNotIn("secret", warnings[0])
+        self.assertNotIn("INSERT", warnings[0])
+        # Полное исключение с SQL и параметрами доступно только на уровне debug
+        debug = [r for r in logs.records if r.levelname == "DEBUG"]
+        self.assertEqual(len(debug), 1)
+        self.assertIsNotNone(debug[0].exc_info)
+
+    async def test_other_db_error_returns_500(self):
+        error = OperationalError(
+            "SELECT * FROM operators WHERE name = ?", ("secret",), Exception("disk I/O")
+        )
+        with (
+            mock.patch("app.controllers.OperatorRepository.get_all", side_effect=error),
+            self.assertLogs("main", level="ERROR") as logs,
+        ):
+            response = await self.client.get("/operators")
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {"detail": "Внутренняя ошибка БД"})
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("disk I/O", logs.records[0].getMessage())
+        self.assertNotIn("secret", logs.output[0])
+
+    async def test_update_missing_operator_returns_404(self):
+        response = await self.client.patch(
+            "/operators/999",
+            json={"name": None, "is_active": False, "max_concurrent": None},
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"detail": "Operator not found"})
+
+
+if __name__ == "__main__":
+    unittest.main()
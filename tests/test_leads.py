@@ -0,0 +1,72 @@
+import unittest
+
+from app.db import SessionLocal
+from app.schemas import Lead
+from app.services import LeadService
+from tests.base import ApiTestCase
+
+"""
+Тесты идентификации лида по признакам обращения
+"""
+
+
+class FindOrCreateLeadTest(ApiTestCase):
+    """
+    Приоритет совпадения: external_id, затем телефон, затем эл. почта; при равенстве - меньший id
+    """
+
+    async def _create_leads(self, *leads: dict) -> list:
+        async with SessionLocal() as db_session, db_session.begin():
+            objects = [Lead(**lead) for lead in leads]
+            db_session.add_all(objects)
+        return [lead.id for lead in objects]
+
+    async def _find_or_create(self, **fields) -> int:
+        async with SessionLocal() as db_session, db_session.begin():
+            lead = await LeadService.find_or_create_lead(
+                db_session,
+                external_id=fields.get("external_id"),
+                phone=fields.get("phone"),
+                email=fields.get("email"),
+            )
+        return lead.id
+
+    async def test_priority_external_id_phone_email(self):
+        # Каждый лид совпадает с обращением по своему признаку; лид по external_id создан последним
+        by_email, by_phone, by_external_id = await self._create_leads(
+            {"email": "a@example.com"},
+            {"phone": "+7000"},
+            {"external_id": "tg-1"},
+        )
+        fields = {"external_id": "tg-1", "phone": "+7000", "email": "a@example.com"}
+
+        self.assertEqual(await self._find_or_create(**fields), by_external_id)
+        fields["external_id"] = "tg-2"
+        self.assertEqual(await self._find_or_create(**fields), by_phone)
+        fields["phone"] = "+7999"
+        self.assertEqual(await self._find_or_create(**fields), by_email)
+
+    async def test_same_priority_prefers_lowest_id(self):
+        first, second = await self._create_leads(
+            {"phone": "+7000", "email": "b@example.com"},
+            {"phone": "+7000", "email": "a@example.com"},
+        )
+
+        self.assertEqual(await self._find_or_create(phone="+7000"), first)
+        # Совпадение по телефону у обоих; эл. почта второго лида приоритет не меняет
+        self.assertEqual(
+            await self._find_or_create(phone="+7000", email="a@example.com"), first
+        )
+        self.assertEqual(await self._find_or_create(email="a@example.com"), second)
+
+    async def test_creates_lead_when_nothing_matches(self):
+        (existing,) = await self._create_leads({"phone": "+7000"})
+
+        created = await self._find_or_create(phone="+7001", email="c@example.com")
+
+        self.assertNotEqual(created, existing)
+        self.assertEqual(await self._find_or_create(email="c@example.com"), created)
+
+
+if __name__ == "__main__":
+    unittest.main()
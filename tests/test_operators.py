@@ -0,0 +1,68 @@
+import unittest
+
+from app.db import SessionLocal
+from app.models import OperatorUpdate
+from app.repository import OperatorRepository
+from tests.base import ApiTestCase
+
+"""
+Тесты обновления операторов
+"""
+
+
+class OperatorUpdateTest(ApiTestCase):
+    """
+    PATCH /operators/{operator_id}: пустое обновление и UPDATE ... RETURNING
+    """
+
+    async def test_patch_updates_and_returns_operator(self):
+        operator_id = await self._create_operator("A", max_concurrent=5)
+
+        response = await self.client.patch(
+            f"/operators/{operator_id}",
+            json={"name": None, "is_active": False, "max_concurrent": 7},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        expected = {
+            "id": operator_id,
+            "name": "A",
+            "is_active": False,
+            "max_concurrent": 7,
+        }
+        self.assertEqual(response.json(), expected)
+        response = await self.client.get("/operators")
+        self.assertEqual(response.json(), [expected])
+
+    async def test_empty_patch_returns_operator_unchanged(self):
+        operator_id = await self._create_operator("A", max_concurrent=5)
+
+        response = await self.client.patch(
+            f"/operators/{operator_id}",
+            json={"name": None, "is_active": None, "max_concurrent": None},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {"id": operator_id, "name": "A", "is_active": True, "max_concurrent": 5},
+        )
+
+    async def test_update_leaves_no_open_transaction(self):
+        operator_id = await self._create_operator("A", max_concurrent=5)
+        updates = (
+            OperatorUpdate(name=None, is_active=None, max_concurrent=None),
+            OperatorUpdate(name=None, is_active=None, max_concurrent=6),
+        )
+
+        for data in updates:
+            async with SessionLocal() as db_session:
+                operator = await OperatorRepository.update(
+                    db_session, data, operator_id=operator_id
+                )
+                self.assertEqual(operator.id, operator_id)
+                self.assertFalse(db_session.in_transaction())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+
+from tests.base import ApiTestCase
+
+"""
+Регрессионные тесты маршрутизации при параллельных запросах
+"""
+
+
+class RoutingConcurrencyTest(ApiTestCase):
+    """
+    Параллельные обращения не должны превышать max_concurrent операторов
+    """
+
+    async def _create_routed_source(self, code: str) -> None:
+        """
+        Источник с двумя операторами: лимиты 5 и 3
+        """
+        first = await self._create_operator("A", max_concurrent=5)
+        second = await self._create_operator("B", max_concurrent=3)
+        await self._create_source(code, {first: 10, second: 30})
+
+    async def test_concurrent_contacts_respect_max_concurrent(self):
+        await self._create_routed_source("tg")
+        # Лид уже существует: первой записью транзакции становится сама вставка обращения
+        response = await self.client.post("/contacts/tg", json={"phone": "+7000"})
+        self.assertEqual(response.status_code, 200)
+
+        responses = await asyncio.gather(
+            *(
+                self.client.post("/contacts/tg", json={"phone": "+7000"})
+                for _ in range(20)
+            )
+        )
+
+        self.assertEqual({r.status_code for r in responses}, {200})
+        loads = await self._operator_loads()
+        self.assertEqual(loads.get(1), 5)
+        self.assertEqual(loads.get(2), 3)
+        self.assertEqual(loads.get(None), 13)
+
+    async def test_concurrent_batches_respect_max_concurrent(self):
+        await self._create_routed_source("tg")
+        response = await self.client.post("/contacts/tg", json={"phone": "+7000"})
+        self.assertEqual(response.status_code, 200)
+
+        batch = [{"source_code": "tg", "phone": "+7000"}] * 3
+        responses = await asyncio.gather(
+            *(self.client.post("/contacts:batch", json=batch) for _ in range(5)),
+            *(
+                self.client.post("/contacts/tg", json={"phone": "+7000"})
+                for _ in range(10)
+            ),
+        )
+
+        self.assertEqual({r.status_code for r in responses}, {200})
+        loads = await self._operator_loads()
+        self.assertEqual(loads.get(1), 5)
+        self.assertEqual(loads.get(2), 3)
+        self.assertEqual(loads.get(None), 18)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from sqlalchemy import insert, select
+
+from app.db import SessionLocal, engine
+from app.schemas import Base, Contact, Source
+from main import app
+from tests.base import ApiTestCase
+
+"""
+Тесты кэша идентификаторов источников
+"""
+
+
+class SourceCacheTest(ApiTestCase):
+    """
+    Кэш code -> id строится заново при старте и не хранит идентификаторы прежней БД
+    """
+
+    async def _contact_source_id(self, contact_id: int) -> int:
+        async with SessionLocal() as db_session:
+            return await db_session.scalar(
+                select(Contact.source_id).where(Contact.id == contact_id)
+            )
+
+    async def test_restart_on_recreated_db_does_not_reuse_stale_ids(self):
+        # Первый запуск: a=1, b=2, c=3; кэш заполняется при обращениях
+        for code in ("a", "b", "c"):
+            await self._create_source(code)
+        for code in ("a", "c"):
+            response = await self.client.post(f"/contacts/{code}", json={})
+            self.assertEqual(response.status_code, 200)
+
+        # БД пересоздана в обход API (восстановление из копии): b=1, a=2, источника c нет
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(
+                insert(Source), [{"code": "b", "name": "b"}, {"code": "a", "name": "a"}]
+            )
+        # Второй запуск сервиса в том же процессе
+        await self.enterAsyncContext(app.router.lifespan_context(app))
+
+        response = await self.client.post("/contacts/a", json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await self._contact_source_id(response.json()["id"]), 2)
+
+        response = await self.client.post("/contacts/c", json={})
+        self.assertEqual(response.status_code, 400)
+
+        response = await self.client.post(
+            "/contacts:batch", json=[{"source_code": "b"}, {"source_code": "a"}]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c["source_id"] for c in response.json()], [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()